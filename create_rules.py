@@ -1,13 +1,34 @@
 #!/usr/bin/python3
+import gzip
+import mmap
+import os
+import socket
+import stat
 import sys
 
+import orjson
 import requests
-import json
+from requests.adapters import HTTPAdapter
 import random
 import argparse
 import ipaddress
-from typing import Dict
-from typing import Tuple
+import re
+
+
+# Dotted quad with a prefix length, without leading zeros which 'ipaddress' rejects
+_CIDR_RE = re.compile(r'(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})'
+                      r'/(0|[1-9][0-9]?)')
+
+# Address groups created by create_subnets and referenced by the ACL and SEC entries
+_RANDOM_GROUP = "random_group"
+_USER_SUBNETS_GROUP = "user_subnets"
+
+# Actions block shared by all generated ACL and SEC entries, it is only read when serialized
+_ACTION_ACCEPT = {
+    "config": {
+        "forwarding-action": "accept"
+    }
+}
 
 
 def is_valid_ipv4_cidr(ip_with_cidr: str) -> bool:
@@ -21,7 +42,17 @@ def is_valid_ipv4_cidr(ip_with_cidr: str) -> bool:
     bool: True if the string is a valid IPv4 subnet in CIDR notation, False otherwise.
     """
 
-    # 'ipaddress.IPv4Network' function is used to create an IPv4 network object.
+    # The common x.x.x.x/y form is checked with plain integer math, without building a network object.
+    # The subnet is valid if all octets fit in a byte, the prefix is at most 32 and no host bits are set.
+    match = _CIDR_RE.fullmatch(ip_with_cidr)
+    if match is not None:
+        *octets, prefix = map(int, match.groups())
+        if prefix > 32 or any(octet > 255 for octet in octets):
+            return False
+        address = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+        return address & (0xFFFFFFFF >> prefix) == 0
+
+    # Any other form (e.g. an address without a prefix) is left to 'ipaddress.IPv4Network'.
     # If the provided string is not a valid IPv4 subnet, a ValueError exception is raised.
     try:
         ipaddress.IPv4Network(ip_with_cidr)
@@ -41,8 +72,18 @@ def read_file(file_path: str) -> list:
     str_list (list): A list of strings.
     """
     try:
-        with open(file_path, 'r') as file:
-            str_list = [line.strip() for line in file if is_valid_ipv4_cidr(line.strip())]
+        with open(file_path, 'rb') as file:
+            file_stat = os.fstat(file.fileno())
+            # Only a non-empty regular file can be mapped. Pipes, FIFOs and /dev/stdin report size 0
+            # and are read line by line from the file object instead.
+            if stat.S_ISREG(file_stat.st_mode) and file_stat.st_size > 0:
+                # The mapping lets the lines be scanned without loading the whole file into memory
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    lines = (line.strip().decode() for line in iter(mapped_file.readline, b''))
+                    str_list = [line for line in lines if is_valid_ipv4_cidr(line)]
+            else:
+                lines = (line.strip().decode() for line in file)
+                str_list = [line for line in lines if is_valid_ipv4_cidr(line)]
             print(f'Get user subnets: {str_list}')
             return str_list
     except Exception as ex:
@@ -50,14 +91,28 @@ def read_file(file_path: str) -> list:
         sys.exit(-1)
 
 
-def delete_node_firewall(user_pass: Tuple[str, str], headers: Dict[str, str], context: str, server: str,
-                         port: str) -> None:
+def print_result(action: str, response: requests.Response) -> None:
+    """
+    Prints the HTTP response code and, if the server sent one, the response body.
+
+    Parameters:
+    action (str): description of the request, used in the message;
+    response (requests.Response): the server response to the request.
+
+    Returns:
+    None.
+    """
+
+    body = f" {response.content.decode('utf-8', 'replace')}" if response.content else ""
+    print(f"Result for {action}: {response.status_code}{body}\n")
+
+
+def delete_node_firewall(session: requests.Session, context: str, server: str, port: str) -> None:
     """
     Function for deleting all node firewall.
 
     Parameters:
-    user_pass (Tuple[str, str]): tuple containing the username and password for authentication;
-    headers (Dict[str, str]): dictionary with HTTP headers for the request;
+    session (requests.Session): HTTP session with authentication and headers for the requests;
     context (str): the context in which you need to delete node firewall.
     server (str): restconf server.
     port (str): restconf port.
@@ -68,66 +123,55 @@ def delete_node_firewall(user_pass: Tuple[str, str], headers: Dict[str, str], co
 
     print("Delete node firewall...")
     url = f'http://{server}:{port}/restconf/data/clixon-ngfw:contexts/context={context}/firewall'
-    response = requests.delete(url, headers=headers, auth=user_pass)
-    if response.text:
-        print(f"Result for delete node firewall: {response.status_code} {response.text}\n")
-    else:
-        print(f"Result for delete node firewall: {response.status_code}\n")
+    response = session.delete(url)
+    print_result("delete node firewall", response)
 
 
-def create_subnets(user_pass: Tuple[str, str], headers: Dict[str, str], context: str, size: int, server: str,
-                   port: str) -> None:
+def create_subnets(session: requests.Session, context: str, size: int, subnet_list: list, server: str,
+                   port: str, compress: bool = False) -> None:
     """
     Creates groups of randomly generated subnets for a given context.
 
     Parameters:
-    user_pass (Tuple[str, str]): a tuple that contains the username and password for authentication;
-    headers (Dict[str, str]): a dictionary with HTTP headers for the request;
+    session (requests.Session): HTTP session with authentication and headers for the requests;
     context (str): the context in which the subnets need to be created;
     size (int): the number of subnets that need to be created.
+    subnet_list (list): the user subnets read from the file.
     server (str): restconf server.
     port (str): restconf port.
+    compress (bool): send the request body gzip-compressed (the server must accept 'Content-Encoding: gzip').
 
     Returns:
     None. The function sends a PUT request to the server and displays the result in the console.
     """
 
     print(f"Generate subnets...")
+    # The set both deduplicates and holds the result, so every subnet is stored only once
     generated_ips = set()
     address_groups = []
-    subnets = []
-
-    for i in range(1, size + 1):
-        while True:
-            octet_1 = random.randint(1, 255)
-            octet_2 = random.randint(1, 255)
-            octet_3 = random.randint(1, 255)
-            octet_4 = random.randint(1, 255)
 
-            ip = f"{octet_1}.{octet_2}.{octet_3}.{octet_4}/32"
-
-            if ip not in generated_ips:
-                generated_ips.add(ip)
-                subnets.append(ip)
-                break
+    while len(generated_ips) < size:
+        # Draw the octets for all missing subnets in one call instead of four randint calls per subnet
+        octets = random.randbytes(4 * (size - len(generated_ips)))
+        for offset in range(0, len(octets), 4):
+            ip = octets[offset:offset + 4]
+            # Skipping addresses with a zero octet keeps every octet in the range 1..255
+            if 0 in ip:
+                continue
+            generated_ips.add(socket.inet_ntoa(ip) + "/32")
 
     address_groups.append({
-        "group-name": "random_group",
+        "group-name": _RANDOM_GROUP,
         "address-types": {
-            "ip-subnets": [
-                subnets
-            ]
+            "ip-subnets": list(generated_ips)
         }
     })
 
     print(f"Add user subnets...")
-    subnet_list = read_file(args.file)
     address_groups.append({
-        "group-name": "user_subnets",
+        "group-name": _USER_SUBNETS_GROUP,
         "address-types": {
-            "ip-subnets": [
-                subnet_list
-            ]
+            "ip-subnets": subnet_list
         }
     })
 
@@ -137,24 +181,26 @@ def create_subnets(user_pass: Tuple[str, str], headers: Dict[str, str], context:
         }
     }
 
-    response = requests.put(
+    body = orjson.dumps(data)
+    extra_headers = None
+    if compress:
+        # The subnet list grows with size and compresses well, the lowest level is enough for that
+        body = gzip.compress(body, compresslevel=1)
+        extra_headers = {'Content-Encoding': 'gzip'}
+
+    response = session.put(
         f'http://{server}:{port}/restconf/data/clixon-ngfw:contexts/context={context}/firewall/address/ipv4/ipv4-address',
-        headers=headers, data=json.dumps(data), auth=user_pass)
-    if response.text:
-        print(f"Result for add subnets: {response.status_code} {response.text}\n")
-    else:
-        print(f"Result for add subnets: {response.status_code}\n")
+        data=body, headers=extra_headers)
+    print_result("add subnets", response)
 
 
-def create_acl(user_pass: Tuple[str, str], headers: Dict[str, str], context: str, size: int, server: str,
-               port: str) -> None:
+def create_acl(session: requests.Session, context: str, size: int, server: str, port: str) -> None:
     """
     Creates the specified number of Access Control List (ACL) entries with
     the accepting action and adds them to the access policy.
 
     Parameters:
-    user_pass (Tuple[str, str]): a tuple that contains the username and password for authentication;
-    headers (Dict[str, str]): a dictionary with HTTP headers for the request;
+    session (requests.Session): HTTP session with authentication and headers for the requests;
     context (str): the context in which it is necessary to create ACL entries;
     size (int): the number of ACL entries to be created.
     server (str): restconf server.
@@ -165,35 +211,22 @@ def create_acl(user_pass: Tuple[str, str], headers: Dict[str, str], context: str
     """
 
     print(f"Generate ACL...")
-    acl_entries_list = []
-
-    name = "random_group"
-
-    acl_entry = {
-        "sequence-id": size,
-        "actions": {
-            "config": {
-                "forwarding-action": "accept"
-            }
-        },
-        "src-address": [
-            name
-        ]
-    }
-    acl_entries_list.append(acl_entry)
-
-    acl_entry = {
-        "sequence-id": size + 5,
-        "actions": {
-            "config": {
-                "forwarding-action": "accept"
-            }
+    acl_entries_list = [
+        {
+            "sequence-id": size,
+            "actions": _ACTION_ACCEPT,
+            "src-address": [
+                _RANDOM_GROUP
+            ]
         },
-        "src-address": [
-            "user_subnets"
-        ]
-    }
-    acl_entries_list.append(acl_entry)
+        {
+            "sequence-id": size + 5,
+            "actions": _ACTION_ACCEPT,
+            "src-address": [
+                _USER_SUBNETS_GROUP
+            ]
+        }
+    ]
 
     access_policy = {
         "clixon-ngfw:access-policies-ipv4": {
@@ -210,17 +243,13 @@ def create_acl(user_pass: Tuple[str, str], headers: Dict[str, str], context: str
         }
     }
 
-    response = requests.put(
+    response = session.put(
         f'http://{server}:{port}/restconf/data/clixon-ngfw:contexts/context={context}/firewall/access-policies-ipv4',
-        headers=headers, data=json.dumps(access_policy), auth=user_pass)
-    if response.text:
-        print(f"Result for add subnets: {response.status_code} {response.text}\n")
-    else:
-        print(f"Result for add subnets: {response.status_code}\n")
+        data=orjson.dumps(access_policy))
+    print_result("add ACL", response)
 
 
-def create_sec(user_pass: Tuple[str, str], headers: Dict[str, str], context: str, size: int, server: str,
-               port: str) -> None:
+def create_sec(session: requests.Session, context: str, size: int, server: str, port: str) -> None:
     """
     Creates a security policy ('sec') for a given context with prepopulated 'User' rules.
 
@@ -228,8 +257,7 @@ def create_sec(user_pass: Tuple[str, str], headers: Dict[str, str], context: str
     action of accepting packets coming from specified 'User' source networks.
 
     Parameters:
-    user_pass (Tuple[str, str]): a tuple that contains the username and password for authentication;
-    headers (Dict[str, str]): a dictionary with HTTP headers for the request;
+    session (requests.Session): HTTP session with authentication and headers for the requests;
     context (str): the context in which it is necessary to create the SEC entries;
     size (int): size of the SEC entries list;
     server (str): The IP address of the RESTCONF server;
@@ -242,21 +270,16 @@ def create_sec(user_pass: Tuple[str, str], headers: Dict[str, str], context: str
     """
 
     print(f"Generate SEC...")
-    sec_entries_list = []
-
-    sec_entry = {
-        "sequence-id": size + 5,
-        "enabled": "true",
-        "actions": {
-            "config": {
-                "forwarding-action": "accept"
-            }
-        },
-        "src-address": [
-            "user_subnets"
-        ]
-    }
-    sec_entries_list.append(sec_entry)
+    sec_entries_list = [
+        {
+            "sequence-id": size + 5,
+            "enabled": "true",
+            "actions": _ACTION_ACCEPT,
+            "src-address": [
+                _USER_SUBNETS_GROUP
+            ]
+        }
+    ]
 
     access_policy = {
         "clixon-ngfw:security-policies-ipv4": {
@@ -269,13 +292,10 @@ def create_sec(user_pass: Tuple[str, str], headers: Dict[str, str], context: str
         }
     }
 
-    response = requests.put(
+    response = session.put(
         f'http://{server}:{port}/restconf/data/clixon-ngfw:contexts/context={context}/firewall/security-policies-ipv4',
-        headers=headers, data=json.dumps(access_policy), auth=user_pass)
-    if response.text:
-        print(f"Result for add SEC policy: {response.status_code} {response.text}\n")
-    else:
-        print(f"Result for add SEC policy: {response.status_code}\n")
+        data=orjson.dumps(access_policy))
+    print_result("add SEC policy", response)
 
 
 def parse_arguments():
@@ -290,10 +310,12 @@ def parse_arguments():
                         help='Port restconf server. This argument is required.')
     parser.add_argument('-f', '--file', type=str, required=True,
                         help='Path to the file with subnets. This argument is required.')
+    parser.add_argument('-z', '--gzip', action='store_true',
+                        help='Send the subnets gzip-compressed. The server must support it.')
     return parser.parse_args()
 
 
-# Example: create_rules.py -s [num_rules] -c [context_name] -S [server_ip] -p [server_port] -f [file_with_subnets]
+# Example: create_rules.py -s [num_rules] -c [context_name] -S [server_ip] -p [server_port] -f [file_with_subnets] [-z]
 # example file
 # $ cat sub.txt
 # 10.0.0.0/24
@@ -304,11 +326,20 @@ if __name__ == '__main__':
     args = parse_arguments()
     user_pass = ('sysadmin',
                  '$6$Edxj1MHJOWWrst2D$YTkLzv7EFQrSKeYWTq7BSw0Bu33qq5Teo/G.fMs2w0IcY0wwmLB25qVxa6/hHrSMhQvBrrfjaYIJ85d9D6zkj/')
-    headers = {
-        'Content-Type': 'application/yang-data+json',
-    }
 
-    delete_node_firewall(user_pass, headers, args.context, args.server, args.port)
-    create_subnets(user_pass, headers, args.context, args.size, args.server, args.port)
-    create_acl(user_pass, headers, args.context, args.size, args.server, args.port)
-    create_sec(user_pass, headers, args.context, args.size, args.server, args.port)
+    # Read before any request, so a bad file does not leave the firewall already deleted
+    subnet_list = read_file(args.file)
+
+    # One session for all calls keeps the connection to the RESTCONF server alive between requests
+    with requests.Session() as session:
+        # The calls are sequential and go to one server, so a single pooled connection is reused for all of them
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        session.auth = user_pass
+        session.headers['Content-Type'] = 'application/yang-data+json'
+
+        # The calls must stay sequential: the ACL and SEC entries reference the address
+        # groups created by create_subnets, so the server rejects them if they arrive first
+        delete_node_firewall(session, args.context, args.server, args.port)
+        create_subnets(session, args.context, args.size, subnet_list, args.server, args.port, args.gzip)
+        create_acl(session, args.context, args.size, args.server, args.port)
+        create_sec(session, args.context, args.size, args.server, args.port)